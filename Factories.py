@@ -5,6 +5,7 @@ Creates both Widgets and MapItems
 
 from kivy.graphics.transformation import Matrix
 from kivy.uix.image import Image
+from kivy.core.image import Image as CoreImage
 from kivy.uix.scatter import Scatter
 
 #  Importing my own stuff
@@ -30,7 +31,9 @@ class MapItemWidget(Scatter):
     """
     def __init__(self, source='PC.png', **kwargs):
         super(MapItemWidget, self).__init__(**kwargs)
-        self.direction = 'right'
+        #  Direction the widget faces: 1 for right, -1 for left. Comparing the sign of horizontal movement
+        #  to it tells whether the widget should be flipped
+        self.direction = 1
         self.img = Image(source=source, size=(32, 32), allow_stretch=False)
         self.add_widget(self.img)
         self.bind(size=self.update_img)
@@ -42,10 +45,7 @@ class MapItemWidget(Scatter):
         """
         self.apply_transform(Matrix().scale(-1, 1, 1),
                              anchor=self.center)
-        if self.direction == 'right':
-            self.direction = 'left'
-        else:
-            self.direction = 'right'
+        self.direction = -self.direction
 
     def update_img(self, a, b):
         #  Needs to be updated manually, as Scatter does not automatically affect its children sizes
@@ -54,6 +54,11 @@ class MapItemWidget(Scatter):
 
 
 class TileWidgetFactory(object):
+    #  Textures for tiles drawn directly on canvas, one per image file. Kept in the class, so that every
+    #  factory (RLMapWidget creates a new one for every map size) shares them. Filled lazily, because
+    #  textures can only be created after the window is
+    textures = {}
+
     def __init__(self):
         # The dictionary that implements dispatching correct methods for any MapItem class
         self.type_methods = {GroundTile: self.create_tile_widget,
@@ -83,6 +88,19 @@ class TileWidgetFactory(object):
                                     do_rotation=False, do_translation=False)
         return tile.widget
 
+    def get_tile_texture(self, tile):
+        """
+        Return a texture for a GroundTile. It is used to draw background tiles as canvas instructions
+        instead of creating a widget per tile. Textures are loaded once per image file and then shared
+        by all factories
+        :param tile: GroundTile
+        :return: Texture
+        """
+        s = choice(self.passable_tiles) if tile.passable else 'Tile_impassable.png'
+        if s not in self.textures:
+            self.textures[s] = CoreImage(s).texture
+        return self.textures[s]
+
     #  These three methods are similar, but I'll retain three different methods in case something changes about them
     def create_actor_widget(self, actor):
         s = actor.image_source
@@ -115,8 +115,14 @@ class EventDispatcher:
         that signalises that that's it for now. It allows eg animation system to start animating turn
         :return:
         """
-        while len(self._deque) > 0:
-            self.pass_event()
+        #  Inlined pass_event() with method and attribute lookups done once. Events are still taken from the
+        #  deque one by one rather than copied out in bulk, as listeners may add events or clear the queue
+        popleft = self._deque.popleft
+        listeners = self.listeners
+        while self._deque:
+            e = popleft()
+            for listener in listeners:
+                listener.process_game_event(e)
         #  This event cannot be added before other events are passed, because listeners can potentially add
         #  something unforeseen to the queue
         self.append(GameEvent(event_type='queue_exhausted'))
@@ -2,8 +2,6 @@
 Various Listeners that check for win/fail, level switch conditions, achievements and so on.
 NB: There are Listeners defined outside this file, eg some Widgets in camp.py and DijkstraMap in Map.py
 """
-from Actor import Actor
-from Controller import PlayerController
 
 
 class Listener():
@@ -23,7 +21,7 @@ class DeathListener(Listener):
 
     def process_game_event(self, event):
         if event.event_type == 'was_destroyed':
-            if isinstance(event.actor, Actor) and isinstance(event.actor.controller, PlayerController):
+            if event.actor is self.game_manager.pc:
                 print('PC was killed. So it goes.')
 
 class TutorialListener(Listener):
@@ -41,7 +39,7 @@ class TutorialListener(Listener):
                              'Shooter flag', 'Rocket', 'Ammo'}
 
     def process_game_event(self, event):
-        if event.event_type == 'picked_up' and isinstance(event.actor.controller, PlayerController):
+        if event.event_type == 'picked_up' and event.actor is self.game_manager.pc:
             item_name = event.actor.inventory[-1].descriptor.name
             if item_name in self.must_display:
                 self.game_manager.map.extend_log(self.item_lines[item_name])
@@ -54,7 +52,7 @@ class BorderWalkListener(Listener):
     """
     def process_game_event(self, event):
         if event.event_type == 'moved':
-            if isinstance(event.actor, Actor) and isinstance(event.actor.controller, PlayerController):
+            if event.actor is self.game_manager.pc:
                 if event.actor.location[0] == 0:
                     self.game_manager.switch_map(self.game_manager.map.neighbour_maps['west'],
                                                  entrance_direction='west')
@@ -77,6 +75,5 @@ class MapChangeListener(Listener):
     """
     def process_game_event(self, event):
         if event.event_type == 'moved':
-            if isinstance(event.actor, Actor) and isinstance(event.actor.controller, PlayerController)\
-                        and event.actor.location[1] <= 1:
+            if event.actor is self.game_manager.pc and event.actor.location[1] <= 1:
                 self.game_manager.switch_map('empty')
\ No newline at end of file
@@ -36,6 +36,8 @@ class DijkstraMap(Listener):
         #  the game starts.
         self.attractor_filters = attractor_filters
         self.attractors = []
+        #  Set to True whenever values are recalculated. Can be reset by whoever displays the map
+        self.changed = True
 
     def rebuild_self(self):
         """
@@ -44,6 +46,7 @@ class DijkstraMap(Listener):
         """
         #  Initializing data container. It should be the same size as the map in question
         self._values = [[None for x in range(self.map.size[1])] for y in range(self.map.size[0])]
+        self.changed = True
         for x in range(self.map.size[0]):
             for y in range(self.map.size[1]):
                 if self.should_ignore((x, y)):
@@ -80,34 +83,35 @@ class DijkstraMap(Listener):
             return True
         return False
 
-    def _breadth_fill(self, filled=set(), value=-5):
+    def _breadth_fill(self, filled=frozenset(), value=-5):
         """
         Fill Dijkstra map breadth-first.
-        This method is recursive and is intended to be started from a single point. Multiple attractors are
+        This method is intended to be started from a single point. Multiple attractors are
         currently not supported (although multiple starting points *may* work if they all have exactly the same
         value. This method relies on at least one cell of Dijkstra map being filled with value and placed
-        in self.updated_now by the moment it's (non-recursively) called.
+        in self.updated_now by the moment it's called.
+        The fill goes one ring of cells per iteration instead of recursing, so there is no call overhead per ring
+        and no recursion limit for large maps.
         :param filled: set. Set of cells (as coordinate tuples) filled on a previous iteration
         :param value: int. Value that the cells from a `filled` set contain
         :return:
         """
-        s = set()
-        for cell in filled:
-            for n in self.map.get_neighbour_coordinates(cell):
-                if n not in self.updated_now:
-                    if not self.should_ignore(n):
-                        s.add(n)
-                    else:
-                        self.set_value(location=(n[0], n[1]), value=None)
-                        self.updated_now.add(n)
-        if s:
+        while filled:
+            s = set()
+            for cell in filled:
+                for n in self.map.get_neighbour_coordinates(cell):
+                    if n not in self.updated_now:
+                        if not self.should_ignore(n):
+                            s.add(n)
+                        else:
+                            self.set_value(location=n, value=None)
+                            self.updated_now.add(n)
+            value += 1
             for cell in s:
-                if self[cell[0]][cell[1]] >= value+1:
-                    self.set_value(location=cell, value=value + 1)
-            self.updated_now = self.updated_now.union(s)
-            self._breadth_fill(filled=s, value=value+1)
-        else:
-            return
+                if self[cell[0]][cell[1]] >= value:
+                    self.set_value(location=cell, value=value)
+            self.updated_now |= s
+            filled = s
 
     def update(self, location=(None, None), value=None):
         """
@@ -116,6 +120,7 @@ class DijkstraMap(Listener):
         :param value:
         :return:
         """
+        self.changed = True
         for x in range(len(self)):
             for y in range(len(self[0])):
                 if self.should_ignore((x, y)):
@@ -4,15 +4,18 @@ import kivy
 kivy.require('1.9.0')
 from kivy.app import App
 from kivy.config import Config
-from kivy.graphics.context_instructions import Rotate, Translate
+from kivy.graphics.context_instructions import Rotate
 from kivy.uix.relativelayout import RelativeLayout
+from kivy.uix.widget import Widget
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.image import Image
+from kivy.core.image import Image as CoreImage
 from kivy.uix.label import Label
-from kivy.graphics import Color, Rectangle
+from kivy.graphics import Color, Rectangle, PushMatrix, PopMatrix
 from kivy.core.window import Window
 from kivy.animation import Animation
 from kivy.core.audio import SoundLoader
+from kivy.clock import Clock
 
 #  My own stuff
 from Factories import TileWidgetFactory, MapLoader
@@ -24,6 +27,7 @@ from Listeners import Listener, DeathListener, BorderWalkListener, TutorialListe
 import sys
 import traceback
 from math import atan2, degrees
+from time import perf_counter
 from collections import deque
 
 #  A collection of constants. Most definitely needs to be refactored into a proper option container
@@ -32,6 +36,41 @@ from collections import deque
 #  Dijkstra display altogether. To avoid creating a new event type, this is redrawn at the end of every turn.
 DISPLAY_DIJKSTRA_MAP = None
 
+#  Duration of a single animation step, in seconds
+ANIMATION_DURATION = 0.2
+#  If animating all events of a turn is expected to take longer than this (in seconds), the turn is shown
+#  instantly instead, without sounds. This avoids locking the keyboard for long after huge explosion chains.
+ANIMATION_TIME_BUDGET = 2.0
+#  Longest time (in seconds) events are processed without yielding to Kivy. If a burst of non-animated events
+#  takes longer, the rest of the queue is processed on the next frame so that rendering doesn't stall
+EVENT_PROCESSING_SLICE = 0.008
+
+#  Precalculated angles (in degrees) for (dx, dy) tile offsets. Used to rotate rocket sprites; offsets beyond
+#  this range are calculated directly
+ANGLE_TABLE = {(dx, dy): degrees(atan2(dy, dx)) for dx in range(-32, 33) for dy in range(-32, 33)
+               if (dx, dy) != (0, 0)}
+
+
+def invert_key_dict(d):
+    """
+    Convert a dict of {value: (key1, key2, ...)} into a dict of {key1: value, key2: value, ...}
+    :param d: dict
+    :return: dict
+    """
+    return {key: value for value, keys in d.items() for key in keys}
+
+
+def build_command_table(types, values):
+    """
+    Build a dict of {key: Command} from key-to-type and key-to-value dicts.
+    Keys whose type is not a valid Command type (eg 'drop', which only opens a window) are skipped
+    :param types: dict
+    :param values: dict
+    :return: dict
+    """
+    return {key: Command(command_type=command_type, command_value=values[key])
+            for key, command_type in types.items() if command_type in Command.acceptable_commands}
+
 
 class KeyParser(object):
     """
@@ -49,7 +88,7 @@ class KeyParser(object):
                                   'n', 'numpad3'), #SE
                          'wait': ('spacebar', '.', 'numpad5'),
                          'grab': ('g', ','),
-                         'drop': ('d')}
+                         'drop': ('d', )}
 
     #  Values for travel commands are (dx, dy)
     #  Values for inventory use and drop are not kept here, as those are used from window
@@ -64,26 +103,28 @@ class KeyParser(object):
                           (1, -1): ('n', 'numpad3'),
                           None: ('spacebar', '.', 'numpad5', 'g', ',')}
 
-    def __init__(self):
-        self.command_types = {}
-        self.command_values = {}
-        #  Initializing commands
-        for a in self.command_type_dict.items():
-            self.command_types.update({x: a[0] for x in a[1]})
-        for a in self.command_value_dict.items():
-            self.command_values.update({x: a[0] for x in a[1]})
+    #  Key-to-command lookup tables. These are built once, when the class is defined
+    command_types = invert_key_dict(command_type_dict)
+    command_values = invert_key_dict(command_value_dict)
+    #  Commands are never modified after creation, so a single instance per key is shared
+    commands = build_command_table(command_types, command_values)
+    #  Inventory commands for every item number, indexed by that number
+    use_item_commands = tuple(Command(command_type='use_item', command_value=(x, )) for x in range(10))
+    drop_item_commands = tuple(Command(command_type='drop_item', command_value=(x, )) for x in range(10))
+    #  Numbers for digit keys, both regular and numpad ones
+    number_keys = {prefix+str(x): x for prefix in ('', 'numpad') for x in range(10)}
 
     @staticmethod
     def key_to_number(keycode):
         """
-        Return a number that corresponds to this key. The number is passed to int() after optional numpad_ removed.
+        Return a number that corresponds to this key, either a regular or a numpad one.
         ValueError is raised if key is not numerical
         :param keycode: kivy keycode
         :return:
         """
-        if 'numpad' in keycode[1] or keycode[1] in '1234567890':
-            return int(keycode[1][-1])
-        else:
+        try:
+            return KeyParser.number_keys[keycode[1]]
+        except KeyError:
             raise ValueError('Non-numerical key passed to key_to_number')
 
     def key_to_command(self, keycode):
@@ -92,7 +133,7 @@ class KeyParser(object):
         :param keycode:
         :return:
         """
-        return Command(command_type=self.command_types[keycode[1]], command_value=self.command_values[keycode[1]])
+        return self.commands[keycode[1]]
 
 
 class GameManager():
@@ -100,14 +141,22 @@ class GameManager():
     A singleton game manager. It holds data about current map, GameEvent queue and so on.
     Basically anything that is neither interface nor is limited to a single map/actor belongs here
     """
+    #  PC location on the new map for every entrance direction. Takes old location and new map size
+    entrance_locations = {'north': lambda location, size: [location[0], size[1]-1],
+                          'south': lambda location, size: [location[0], 0],
+                          'west': lambda location, size: [size[0]-1, location[1]],
+                          'east': lambda location, size: [0, location[1]]}
+
     def __init__(self, map_file='test_level.lvl'):
         self.queue = EventDispatcher()
         self.map_loader = MapLoader()
         self.map_loader.read_map_file(map_file)
         self.map = None
         self.game_widget = None
-        #  Log list. Initial values allow not to have empty log at the startup
-        self.game_log = []
+        #  Player character. It is the same Actor on every map, so it can be compared by identity
+        self.pc = None
+        #  Log lines not yet shown by LogWindow. Lines are taken from the left as they are drawn
+        self.game_log = deque()
 
     def _load_map(self, map_id='start'):
         """
@@ -138,15 +187,9 @@ class GameManager():
         if len(self.map.entrance_message) > 0:
             self.map.extend_log(self.map.entrance_message)
         if pc:  # pc is None only for the first map loaded just after starting the app
-            if entrance_direction == 'north':
-                pc.location = [pc.location[0], self.map.size[1]-1]
-            elif entrance_direction == 'south':
-                pc.location = [pc.location[0], 0]
-            elif entrance_direction == 'west':
-                pc.location = [self.map.size[0]-1, pc.location[1]]
-            elif entrance_direction == 'east':
-                pc.location = [0, pc.location[1]]
-            else:
+            try:
+                pc.location = self.entrance_locations[entrance_direction](pc.location, self.map.size)
+            except KeyError:
                 raise ValueError('Only one of north, south, west or east is accepted as entrance_direction')
             #  There may be zero actors on the map, if there are no enemies and (wrong) PC was removed upon load
             if len(self.map.actors) >= 1 and isinstance(self.map.actors[0].controller, PlayerController):
@@ -154,6 +197,7 @@ class GameManager():
             self.map.add_item(item=pc, layer='actors', location=pc.location)
             self.game_widget.rebuild_map_widget()
         else:
+            self.pc = self.map.actors[0]
             #  These events are necessary to initialize UI
             self.queue.append(GameEvent(event_type='hp_changed',
                                         actor=self.map.actors[0]))
@@ -200,6 +244,41 @@ class GameWidget(RelativeLayout):
     Main game widget. Includes map, as well as various other widgets, as children.
     The game state is tracked by this widget's self.state
     """
+    #  Keys not in this set are ignored by _on_key_down
+    allowed_keys = frozenset([  # Movement
+                              'spacebar', '.',
+                              'h', 'j', 'k', 'l',
+                              'y', 'u', 'b', 'n',
+                              'up', 'down', 'left', 'right',
+                              'numpad1', 'numpad2', 'numpad3', 'numpad4', 'numpad5',
+                              'numpad6', 'numpad7', 'numpad8', 'numpad9', 'numpad0',
+                              #  PC stats viewctory.create_widget(a)
+                              'c',
+                              #  Used for inventory & spell systems
+                              '0', '1', '2', '3', '4', '5',
+                              '6', '7', '8', '9',
+                              #  Inventory management
+                              'g', ',', 'd', 'i',
+                              #  Targeted effects
+                              'z', 'x', 'f',
+                              #  Others
+                              'escape', 'enter', 'numpadenter'])
+    #  Keys in this set are processed by self.map_widget.map
+    map_keys = frozenset(['spacebar', '.',
+                          'h', 'j', 'k', 'l',
+                          'y', 'u', 'b', 'n',
+                          'up', 'down', 'left', 'right',
+                          'numpad1', 'numpad2', 'numpad3', 'numpad4', 'numpad5',
+                          'numpad6', 'numpad7', 'numpad8', 'numpad9',
+                          'g', ','])
+    #  Keys that close any window or cursor, returning to 'playing' state
+    close_keys = frozenset(['i', 'c', 'g', 'd', 'escape'])
+    #  Keys that finish targeting in every targeting state
+    targeting_confirm_keys = {'jump_targeting': frozenset(['z', 'enter', 'numpadenter']),
+                              'examine_targeting': frozenset(['x', 'enter', 'numpadenter']),
+                              'fire_targeting': frozenset(['f', 'enter', 'numpadenter']),
+                              'item_targeting': frozenset(['enter', 'numpadenter'])}
+
     def __init__(self, game_manager=None, **kwargs):
         super(GameWidget, self).__init__(**kwargs)
         #  Widget-related stuff
@@ -216,41 +295,13 @@ class GameWidget(RelativeLayout):
                         'exploded': SoundLoader.load('dsbarexp.wav'),
                         'shot': SoundLoader.load('dspistol.wav')}
         #  Sound in kivy seems to be loaded lazily. Files are not actually read until they are necessary,
-        #  which leads to lags for up to half a second when a sound is used for the first time. The following
-        #  two lines are forcing them to be loaded right now.
-        for sound in self.boombox.keys():
-            self.boombox[sound].seek(0)
+        #  which leads to lags for up to half a second when a sound is used for the first time. They are
+        #  forced to load on the first frame, so that the window is shown before that.
+        Clock.schedule_once(self.preload_sounds)
         #  Keyboard controls
         #  Initializing keyboard bindings and key lists
         self._keyboard = Window.request_keyboard(self._keyboard_closed, self)
         self._keyboard.bind(on_key_down=self._on_key_down)
-        #  Keys not in this list are ignored by _on_key_down
-        self.allowed_keys = [  # Movement
-                             'spacebar', '.',
-                             'h', 'j', 'k', 'l',
-                             'y', 'u', 'b', 'n',
-                             'up', 'down', 'left', 'right',
-                             'numpad1', 'numpad2', 'numpad3', 'numpad4', 'numpad5',
-                             'numpad6', 'numpad7', 'numpad8', 'numpad9', 'numpad0',
-                             #  PC stats viewctory.create_widget(a)
-                             'c',
-                             #  Used for inventory & spell systems
-                             '0', '1', '2', '3', '4', '5',
-                             '6', '7', '8', '9',
-                             #  Inventory management
-                             'g', ',', 'd', 'i',
-                             #  Targeted effects
-                             'z', 'x', 'f',
-                             #  Others
-                             'escape', 'enter', 'numpadenter']
-        #  Keys in this list are processed by self.map_widget.map
-        self.map_keys = ['spacebar', '.',
-                         'h', 'j', 'k', 'l',
-                         'y', 'u', 'b', 'n',
-                         'up', 'down', 'left', 'right',
-                         'numpad1', 'numpad2', 'numpad3', 'numpad4', 'numpad5',
-                         'numpad6', 'numpad7', 'numpad8', 'numpad9',
-                         'g', ',']
         self.key_parser = KeyParser()
         #  Game state
         self.game_state = 'playing'
@@ -258,6 +309,69 @@ class GameWidget(RelativeLayout):
         self.state_widget = None
         self.target_coordinates = (None, None)
         self.targeted_item_number = None
+        #  Targeting cursors, created on first use and kept afterwards
+        self.cursor_widgets = {}
+        #  Key processing methods for every game state
+        self.state_methods = {'playing': self.process_playing_key,
+                              'stat_window': self.process_window_key,
+                              'examine_window': self.process_window_key,
+                              'drop_window': self.process_drop_window_key,
+                              'jump_targeting': self.process_targeting_key,
+                              'examine_targeting': self.process_targeting_key,
+                              'fire_targeting': self.process_targeting_key,
+                              'item_targeting': self.process_targeting_key}
+        #  Methods for non-map keys in 'playing' state
+        self.playing_key_methods = {'escape': self.stop_game,
+                                    'c': self.show_stat_window,
+                                    'd': self.show_drop_window,
+                                    'z': self.start_jump_targeting,
+                                    'x': self.start_examine_targeting,
+                                    'f': self.start_fire_targeting}
+        self.playing_key_methods.update({x: self.use_item_key for x in '1234567890'})
+        #  Methods that finish targeting for every targeting state
+        self.targeting_methods = {'jump_targeting': self.finish_jump_targeting,
+                                  'examine_targeting': self.finish_examine_targeting,
+                                  'fire_targeting': self.finish_fire_targeting,
+                                  'item_targeting': self.finish_item_targeting}
+        #  Methods for events that are shown by widgets other than self.map_widget
+        #  Those are bound to self rather than to subwidgets, as the latter are replaced by rebuild_widgets()
+        self.nonmap_event_methods = {'log_updated': self.update_log,
+                                     'hp_changed': self.update_hp_and_ammo,
+                                     'ammo_changed': self.update_hp_and_ammo,
+                                     'inventory_updated': self.update_inventory}
+        #  Commands are not processed right away, but processed once per frame. Only the latest command
+        #  is kept, so that key autorepeat can't queue up more turns than there are frames to show them
+        self.pending_commands = deque(maxlen=1)
+        self.turn_trigger = Clock.create_trigger(self.process_pending_commands)
+
+    def preload_sounds(self, dt):
+        """
+        Force loading all sounds in self.boombox
+        :param dt: float. Clock interval, ignored
+        :return:
+        """
+        for sound in self.boombox.values():
+            sound.seek(0)
+
+    def make_turn(self, command):
+        """
+        Schedule a turn with a given command. The turn is processed on the next frame by
+        self.process_pending_commands. If another command is already waiting, it is replaced
+        :param command: Command
+        :return:
+        """
+        self.pending_commands.append(command)
+        self.turn_trigger()
+
+    def process_pending_commands(self, dt):
+        """
+        Make turns for all pending commands. Stops when some turn starts animations, the rest of commands
+        wait until self.map_widget finishes animating and calls this again.
+        :param dt: float. Clock interval, ignored
+        :return:
+        """
+        while self.pending_commands and not self.map_widget.animating:
+            self.game_manager.map.process_turn(command=self.pending_commands.popleft())
 
     def rebuild_widgets(self):
         """
@@ -269,28 +383,30 @@ class GameWidget(RelativeLayout):
         if self.map_widget:
             self.game_manager.queue.unregister_listener(self.map_widget)
             self.remove_widget(self.map_widget)
+        #  All sizes are calculated from map size, rather than read from freshly created widgets
+        map_width = self.game_manager.map.size[0]*32
+        map_height = self.game_manager.map.size[1]*32
         #  Initializing widgets
         self.map_widget = RLMapWidget(map=self.game_manager.map,
-                                      size=(self.game_manager.map.size[0]*32,
-                                            self.game_manager.map.size[1]*32),
+                                      size=(map_width, map_height),
                                       size_hint=(None, None),
                                       pos=(0, 100))
         self.log_widget = LogWindow(id='log_window',
-                                    text='\n'.join(self.game_manager.game_log[-3:]),
-                                    size=(self.map_widget.width+150, 100),
+                                    text='\n'.join(list(self.game_manager.game_log)[-3:]),
+                                    size=(map_width+150, 100),
                                     size_hint=(None, None),
                                     pos=(0, 0),
-                                    text_size=(self.map_widget.width, 100),
+                                    text_size=(map_width, 100),
                                     padding=(20, 5),
                                     font_size=20,
                                     valign='top',
                                     line_height=1)
         self.status_widget = StatusWindow(spacing=10,
-                                          size=(150, self.map_widget.height),
-                                          pos=(self.map_widget.width, self.log_widget.height),
+                                          size=(150, map_height),
+                                          pos=(map_width, 100),
                                           size_hint=(None, None))
-        self.height = self.map_widget.height+self.log_widget.height
-        self.width = self.map_widget.width+self.status_widget.width
+        #  Own size is set in a single assignment before any children are added
+        self.size = (map_width+150, map_height+100)
         self.add_widget(self.map_widget)
         self.add_widget(self.log_widget)
         self.add_widget(self.status_widget)
@@ -303,8 +419,12 @@ class GameWidget(RelativeLayout):
     def rebuild_map_widget(self):
         """
         Rebuild the map widget, leaving others as they are
+        If the new map is the same size as the current one, the existing map widget is reused
         :return:
         """
+        if self.map_widget.map.size == self.game_manager.map.size:
+            self.map_widget.adopt_map(self.game_manager.map)
+            return
         self.game_manager.queue.unregister_listener(self.map_widget)
         self.remove_widget(self.map_widget)
         self.map_widget = RLMapWidget(map=self.game_manager.map,
@@ -318,162 +438,201 @@ class GameWidget(RelativeLayout):
     def _on_key_down(self, keyboard, keycode, text, modifier):
         """
         Process a single keypress
+        The actual processing is done by the method from self.state_methods for the current game state
         :param keycode:
         :param text:
         :param modifier:
         :return:
         """
+        #  Ignore unknown keys. This is checked first, as it needs no attribute chain
+        if keycode[1] not in self.allowed_keys:
+            return
         #  Do nothing if animation is still running
         if self.map_widget.animating:
             return
-        if keycode[1] in self.allowed_keys:
-            #  Ignore unknown keys
-            if self.game_state == 'playing':
-                #  Either make a turn or show one of windows
-                if keycode[1] in self.map_keys:
-                    #  If the key is a 'map-controlling' one, ie uses a turn without calling further windows
-                    command = self.key_parser.key_to_command(keycode)
-                    self.game_manager.map.process_turn(command=command)
-                elif keycode[1] == 'escape':
-                    App.get_running_app().stop()
-                #  The following checks set various game states but don't, by themselves, produce commands
-                elif keycode[1] in 'c':
-                    #  Displaying player stats window
-                    self.game_state = 'stat_window'
-                    self.state_widget = LogWindow(pos=(200, 200),
-                                                  size=(200, 200),
-                                                  size_hint=(None, None),
-                                                  text=self.map_widget.map.actors[0].descriptor.get_description(
-                                                     combat=True))
-                    self.add_widget(self.state_widget)
-                elif keycode[1] in 'd':
-                    self.game_state = 'drop_window'
-                    self.state_widget = LogWindow(pos=(200, 200),
-                                                  size=(200, 200),
-                                                  size_hint=(None, None),
-                                                  text=self.map_widget.map.actors[0].inventory.get_string())
-                    self.add_widget(self.state_widget)
-                elif keycode[1] in 'z':
-                    self.game_state = 'jump_targeting'
-                    self.target_coordinates = self.map_widget.map.actors[0].location
-                    self.state_widget = Image(source='JumpTarget.png',
-                                              pos=self.map_widget.get_screen_pos(self.target_coordinates,
-                                                                                 parent=True),
-                                              size=(32, 32),
-                                              size_hint=(None, None))
-                    self.add_widget(self.state_widget)
-                elif keycode[1] in 'x':
-                    self.game_state = 'examine_targeting'
-                    self.target_coordinates = self.map_widget.map.actors[0].location
-                    self.state_widget = Image(source='ExamineTarget.png',
-                                              pos=self.map_widget.get_screen_pos(self.target_coordinates,
-                                                                                 parent=True),
-                                              size=(32, 32),
-                                              size_hint=(None, None))
-                    self.add_widget(self.state_widget)
-                elif keycode[1] in 'f':
-                    self.game_state = 'fire_targeting'
-                    self.target_coordinates = self.map_widget.map.actors[0].location
-                    self.state_widget = Image(source='FireTarget.png',
-                                              pos=self.map_widget.get_screen_pos(self.target_coordinates,
-                                                                                   parent=True),
-                                              size=(32, 32),
-                                              size_hint=(None, None))
-                    self.add_widget(self.state_widget)
-                elif keycode[1] in '1234567890':
-                    try:
-                        item_number = self.key_parser.key_to_number(keycode)
-                        item = self.game_manager.map.actors[0].inventory[item_number]
-                        if not item.effect.require_targeting:
-                            command = Command(command_type='use_item',
-                                              command_value=(self.key_parser.key_to_number(keycode), ))
-                            self.game_manager.map.process_turn(command=command)
-                        else:
-                            self.game_state = 'item_targeting'
-                            self.target_coordinates = self.game_manager.map.actors[0].location
-                            self.state_widget = Image(source='FireTarget.png',
-                                                      pos=self.map_widget.get_screen_pos(self.target_coordinates,
-                                                                                         parent=True),
+        self.state_methods[self.game_state](keycode)
+
+    def process_playing_key(self, keycode):
+        """
+        Process a key in 'playing' state: either make a turn or show one of windows
+        :param keycode:
+        :return:
+        """
+        key = keycode[1]
+        if key in self.map_keys:
+            #  If the key is a 'map-controlling' one, ie uses a turn without calling further windows
+            command = self.key_parser.key_to_command(keycode)
+            self.make_turn(command)
+        elif key in self.playing_key_methods:
+            self.playing_key_methods[key](keycode)
+
+    def stop_game(self, keycode):
+        App.get_running_app().stop()
+
+    #  The following methods set various game states but don't, by themselves, produce commands
+    def show_stat_window(self, keycode):
+        #  Displaying player stats window
+        self.game_state = 'stat_window'
+        self.state_widget = LogWindow(pos=(200, 200),
+                                      size=(200, 200),
+                                      size_hint=(None, None),
+                                      text=self.map_widget.map.actors[0].descriptor.get_description(
+                                         combat=True))
+        self.add_widget(self.state_widget)
+
+    def show_drop_window(self, keycode):
+        self.game_state = 'drop_window'
+        self.state_widget = LogWindow(pos=(200, 200),
+                                      size=(200, 200),
+                                      size_hint=(None, None),
+                                      text=self.map_widget.map.actors[0].inventory.get_string())
+        self.add_widget(self.state_widget)
+
+    def start_targeting(self, game_state, image_source):
+        """
+        Switch to a targeting game state and show the targeting cursor at PC location
+        :param game_state: str. One of targeting states
+        :param image_source: str. Cursor image
+        :return:
+        """
+        self.game_state = game_state
+        #  A tuple copy, so that the cursor never shares a mutable location list with PC
+        self.target_coordinates = tuple(self.map_widget.map.actors[0].location)
+        if image_source not in self.cursor_widgets:
+            self.cursor_widgets[image_source] = Image(source=image_source,
                                                       size=(32, 32),
                                                       size_hint=(None, None))
-                            self.targeted_item_number = item_number
-                            self.add_widget(self.state_widget)
-                    except IndexError:
-                        pass
+        self.state_widget = self.cursor_widgets[image_source]
+        self.state_widget.pos = self.map_widget.get_screen_pos(self.target_coordinates, parent=True)
+        self.add_widget(self.state_widget)
+
+    def start_jump_targeting(self, keycode):
+        self.start_targeting('jump_targeting', 'JumpTarget.png')
+
+    def start_examine_targeting(self, keycode):
+        self.start_targeting('examine_targeting', 'ExamineTarget.png')
+
+    def start_fire_targeting(self, keycode):
+        self.start_targeting('fire_targeting', 'FireTarget.png')
+
+    def use_item_key(self, keycode):
+        """
+        Use the item with the number corresponding to keycode, or start targeting it if necessary
+        :param keycode:
+        :return:
+        """
+        try:
+            item_number = self.key_parser.key_to_number(keycode)
+            item = self.game_manager.map.actors[0].inventory[item_number]
+            if not item.effect.require_targeting:
+                self.make_turn(self.key_parser.use_item_commands[item_number])
             else:
-                #  Process various non-'playing' game states, hopefully making a command
-                if ('window' in self.game_state or 'targeting' in self.game_state) \
-                        and keycode[1] in ('i', 'c', 'g', 'd', 'escape'):
-                    #  Escape and window-calling buttons switch state to 'playing', doing nothing else
-                    self.remove_widget(self.state_widget)
-                    self.game_state = 'playing'
-                elif self.game_state == 'drop_window':
-                    #  Try to use keycode as drop command
-                    try:
-                        n = self.key_parser.key_to_number(keycode)
-                        command = Command(command_type='drop_item', command_value=(n, ))
-                        #  Remove inventory widget upon using item
-                        self.remove_widget(self.state_widget)
-                        self.game_state = 'playing'
-                        self.game_manager.map.process_turn(command=command)
-                    except ValueError:
-                        pass
-                elif 'targeting' in self.game_state:
-                    if self.game_state == 'jump_targeting' and keycode[1] in ('z', 'enter', 'numpadenter'):
-                        #  Finish jump targeting
-                        delta = (self.target_coordinates[0]-self.map_widget.map.actors[0].location[0],
-                                 self.target_coordinates[1]-self.map_widget.map.actors[0].location[1])
-                        command = Command(command_type='jump', command_value=delta)
-                        self.game_state = 'playing'
-                        self.remove_widget(self.state_widget)
-                        self.game_manager.map.process_turn(command=command)
-                    elif self.game_state == 'examine_targeting' and keycode[1] in ('x', 'enter', 'numpadenter'):
-                        #  Examine whatever is under cursor
-                        self.game_state = 'examine_window'
-                        self.remove_widget(self.state_widget)
-                        try:
-                            t = self.map_widget.map.get_top_item(location=self.target_coordinates).descriptor.get_description(
-                                combat=True)
-                        except AttributeError:
-                            t = 'Nothing of note'
-                        self.state_widget = LogWindow(pos=(200, 200),
-                                                      size=(200, 200),
-                                                      size_hint=(None, None),
-                                                      text=t)
-                        self.add_widget(self.state_widget)
-                    elif self.game_state == 'fire_targeting' and keycode[1] in ('f', 'enter', 'numpadenter'):
-                        self.game_state = 'playing'
-                        self.remove_widget(self.state_widget)
-                        if self.target_coordinates == self.game_manager.map.actors[0].location:
-                            #  No shooting at yourself
-                            self.game_manager.game_log.append('Your life doesn\'t suck *that* much.')
-                            self.game_manager.queue.append(GameEvent(event_type='log_updated'))
-                            self.game_manager.queue.pass_all_events()
-                        else:
-                            #  Shooting at someone else is okay
-                            command = Command(command_type='shoot',
-                                              command_value=self.target_coordinates)
-                            self.game_manager.map.process_turn(command)
-                    elif self.game_state == 'item_targeting' and keycode[1] in ('enter', 'numpadenter'):
-                        #  Apply item to the nearest collidable tile towards the cursor
-                        hit_coordinates = self.game_manager.map.get_line(
-                            self.game_manager.map.actors[0].location,
-                            self.target_coordinates)[-1]
-                        command = Command(command_type='use_item',
-                                          command_value=(self.targeted_item_number,
-                                                         hit_coordinates[0],
-                                                         hit_coordinates[1]))
-                        self.game_state = 'playing'
-                        self.remove_widget(self.state_widget)
-                        self.game_manager.map.process_turn(command)
-                    elif keycode[1] in self.key_parser.command_types.keys() and \
-                                    self.key_parser.command_types[keycode[1]] == 'walk':
-                        #  Move the targeting widget
-                        delta = self.key_parser.command_values[keycode[1]]
-                        self.target_coordinates = [self.target_coordinates[0]+delta[0],
-                                                   self.target_coordinates[1]+delta[1]]
-                        self.state_widget.pos = self.map_widget.get_screen_pos(self.target_coordinates,
-                                                                               parent=True)
+                self.start_targeting('item_targeting', 'FireTarget.png')
+                self.targeted_item_number = item_number
+        except IndexError:
+            pass
+
+    def close_state_widget(self):
+        """
+        Remove whatever window or cursor is shown and return to 'playing' state
+        :return:
+        """
+        self.remove_widget(self.state_widget)
+        self.game_state = 'playing'
+
+    def process_window_key(self, keycode):
+        """
+        Process a key in a window state. Escape and window-calling buttons switch state to 'playing',
+        doing nothing else
+        :param keycode:
+        :return:
+        """
+        if keycode[1] in self.close_keys:
+            self.close_state_widget()
+
+    def process_drop_window_key(self, keycode):
+        """
+        Process a key in 'drop_window' state, trying to use keycode as drop command
+        :param keycode:
+        :return:
+        """
+        if keycode[1] in self.close_keys:
+            self.close_state_widget()
+            return
+        try:
+            n = self.key_parser.key_to_number(keycode)
+            #  Remove inventory widget upon using item
+            self.close_state_widget()
+            self.make_turn(self.key_parser.drop_item_commands[n])
+        except ValueError:
+            pass
+
+    def process_targeting_key(self, keycode):
+        """
+        Process a key in one of targeting states: either finish targeting or move the cursor
+        :param keycode:
+        :return:
+        """
+        key = keycode[1]
+        if key in self.close_keys:
+            self.close_state_widget()
+        elif key in self.targeting_confirm_keys[self.game_state]:
+            self.targeting_methods[self.game_state]()
+        elif self.key_parser.command_types.get(key) == 'walk':
+            #  Move the targeting widget
+            dx, dy = self.key_parser.command_values[key]
+            x, y = self.target_coordinates
+            self.target_coordinates = (x+dx, y+dy)
+            self.state_widget.pos = self.map_widget.get_screen_pos(self.target_coordinates,
+                                                                   parent=True)
+
+    def finish_jump_targeting(self):
+        pc_location = self.game_manager.map.actors[0].location
+        delta = (self.target_coordinates[0]-pc_location[0],
+                 self.target_coordinates[1]-pc_location[1])
+        command = Command(command_type='jump', command_value=delta)
+        self.close_state_widget()
+        self.make_turn(command)
+
+    def finish_examine_targeting(self):
+        #  Examine whatever is under cursor
+        self.remove_widget(self.state_widget)
+        self.game_state = 'examine_window'
+        try:
+            t = self.map_widget.map.get_top_item(location=self.target_coordinates).descriptor.get_description(
+                combat=True)
+        except AttributeError:
+            t = 'Nothing of note'
+        self.state_widget = LogWindow(pos=(200, 200),
+                                      size=(200, 200),
+                                      size_hint=(None, None),
+                                      text=t)
+        self.add_widget(self.state_widget)
+
+    def finish_fire_targeting(self):
+        self.close_state_widget()
+        if self.target_coordinates == tuple(self.game_manager.map.actors[0].location):
+            #  No shooting at yourself
+            self.game_manager.game_log.append('Your life doesn\'t suck *that* much.')
+            self.game_manager.queue.append(GameEvent(event_type='log_updated'))
+            self.game_manager.queue.pass_all_events()
+        else:
+            #  Shooting at someone else is okay
+            command = Command(command_type='shoot',
+                              command_value=self.target_coordinates)
+            self.make_turn(command)
+
+    def finish_item_targeting(self):
+        #  Apply item to the nearest collidable tile towards the cursor
+        hit_coordinates = self.game_manager.map.get_line(
+            self.game_manager.map.actors[0].location,
+            self.target_coordinates)[-1]
+        command = Command(command_type='use_item',
+                          command_value=(self.targeted_item_number,
+                                         hit_coordinates[0],
+                                         hit_coordinates[1]))
+        self.close_state_widget()
+        self.make_turn(command)
 
     def _keyboard_closed(self):
         self._keyboard.unbind(on_key_down=self._on_key_down)
@@ -489,12 +648,18 @@ class GameWidget(RelativeLayout):
         :param event:
         :return:
         """
-        if event.event_type == 'log_updated':
-            self.log_widget.draw_log_line()
-        elif (event.event_type == 'hp_changed' or event.event_type == 'ammo_changed') and\
-                isinstance(event.actor.controller, PlayerController):
+        if event.event_type in self.nonmap_event_methods:
+            self.nonmap_event_methods[event.event_type](event)
+
+    def update_log(self, event):
+        self.log_widget.draw_log_line()
+
+    def update_hp_and_ammo(self, event):
+        if event.actor is self.game_manager.pc:
             self.status_widget.update_hp_and_ammo()
-        elif event.event_type == 'inventory_updated' and isinstance(event.actor.controller, PlayerController):
+
+    def update_inventory(self, event):
+        if event.actor is self.game_manager.pc:
             self.status_widget.update_inventory()
 
 
@@ -502,6 +667,7 @@ class LayerWidget(RelativeLayout):
     """
     A map layer widget.
     Displays a single layer of a map: items, or actors, or bg, or something.
+    'bg' layer is drawn as canvas instructions, other layers contain a widget per map item.
     Depends on its parent having the following attributes:
     self.parent.map  a Map instance with a layer corresponding to this widget
     tile_factory  a TileWidgetFactory instance
@@ -513,35 +679,92 @@ class LayerWidget(RelativeLayout):
         #  When the widget is in use, it'll be self.parent, but the widget cannot be attached before
         #  it is constructed
         self.size = parent.size
-        #  Initializing tile widgets
-        for x in range(parent.map.size[0]):
-            for y in range(parent.map.size[1]):
-                item = parent.map.get_item(layer=self.layer, location=(x, y))
+        if self.layer == 'bg':
+            #  Background never changes, so it is drawn as canvas rectangles instead of a widget per tile
+            self.tile_rects = {}
+            with self.canvas:
+                Color(1, 1, 1, 1)
+            self.draw_bg(parent)
+            return
+        #  Initializing tile widgets. Layer contents are walked directly, column by column, rather than
+        #  calling get_item for every location. Methods used in the loop are looked up once
+        create_widget = parent.tile_factory.create_widget
+        get_screen_pos = parent.get_screen_pos
+        add_widget = self.add_widget
+        for x, column in enumerate(parent.map.items[self.layer]):
+            for y, item in enumerate(column):
                 if item:
-                    tile_widget = parent.tile_factory.create_widget(item)
-                    tile_widget.center = parent.get_screen_pos((x, y), center=True)
-                    self.add_widget(tile_widget)
+                    tile_widget = create_widget(item)
+                    tile_widget.center = get_screen_pos((x, y), center=True)
+                    add_widget(tile_widget)
+
+    def draw_bg(self, parent):
+        """
+        Draw background tiles of parent.map as canvas rectangles.
+        Existing rectangles are reused, so this can be called again to show another map of the same size
+        :param parent: RLMapWidget
+        :return:
+        """
+        for x, column in enumerate(parent.map.items[self.layer]):
+            for y, item in enumerate(column):
+                rect = self.tile_rects.get((x, y))
+                if item and rect:
+                    rect.texture = parent.tile_factory.get_tile_texture(item)
+                elif item:
+                    with self.canvas:
+                        self.tile_rects[(x, y)] = Rectangle(texture=parent.tile_factory.get_tile_texture(item),
+                                                            pos=parent.get_screen_pos((x, y)),
+                                                            size=(32, 32))
+                elif rect:
+                    self.canvas.remove(rect)
+                    del self.tile_rects[(x, y)]
 
 
 class DijkstraWidget(RelativeLayout):
     """
     The widget that displays little numbers on every tile to allow debugging Dijkstra maps.
-    This widget is designed to be a child of RLMapWidget, so it relies on its methods
-    For such a crude testing thing I won't even write updating: let's just remove it and create
-    anew every time Dijkstra map is updated. Therefore it's immensely laggy and performance of anything
-    should be tested with it disabled.
+    This widget is designed to be a child of RLMapWidget, so it relies on its methods.
+    Labels are created once, and self.update() only changes text of labels whose values have changed.
+    Still, performance of anything should be tested with it disabled.
     """
-    def __init__(self, parent = None, **kwargs):
+    def __init__(self, parent=None, **kwargs):
         super(DijkstraWidget, self).__init__(**kwargs)
+        self.map = parent.map
+        #  Labels are stored as self.labels[x][y]
+        self.labels = []
         for x in range(parent.map.size[0]):
+            column = []
             for y in range(parent.map.size[1]):
-                self.add_widget(Label(size=(64, 64),
-                                      size_hint=(None, None),
-                                      pos=parent.get_screen_pos((x, y)),
-                                      text=str(parent.map.dijkstras[DISPLAY_DIJKSTRA_MAP][x][y]),
-                                      text_size=(64, 64),
-                                      font_size=7,
-                                      color=(0, 0, 0, 1)))
+                label = Label(size=(64, 64),
+                              size_hint=(None, None),
+                              pos=parent.get_screen_pos((x, y)),
+                              text_size=(64, 64),
+                              font_size=7,
+                              color=(0, 0, 0, 1))
+                column.append(label)
+                self.add_widget(label)
+            self.labels.append(column)
+        #  Values currently shown by labels. Filled with something that is never a Dijkstra value, so that
+        #  the first update sets every label
+        self.values = [[False for y in range(parent.map.size[1])] for x in range(parent.map.size[0])]
+        self.update(force=True)
+
+    def update(self, force=False):
+        """
+        Set label texts according to the current values of the displayed Dijkstra map.
+        Does nothing if the Dijkstra map wasn't recalculated since the last update
+        :param force: bool. If True, update even if Dijkstra map is not marked as changed
+        :return:
+        """
+        dijkstra = self.map.dijkstras[DISPLAY_DIJKSTRA_MAP]
+        if not dijkstra.changed and not force:
+            return
+        dijkstra.changed = False
+        for labels, shown, values in zip(self.labels, self.values, dijkstra):
+            for y, value in enumerate(values):
+                if shown[y] is False or shown[y] != value:
+                    labels[y].text = str(value)
+                    shown[y] = value
 
 
 class RLMapWidget(RelativeLayout, Listener):
@@ -556,6 +779,13 @@ class RLMapWidget(RelativeLayout, Listener):
                     'inventory_updated',
                     'hp_changed',
                     'ammo_changed'}
+    #  Expected animation length for animated event types, in animation steps
+    animation_lengths = {'moved': 1,
+                         'attacked': 1,
+                         'was_destroyed': 1,
+                         'exploded': 3,
+                         'rocket_shot': 1,
+                         'shot': 1}
 
     def __init__(self, map=None, **kwargs):
         super(RLMapWidget, self).__init__(**kwargs)
@@ -563,6 +793,10 @@ class RLMapWidget(RelativeLayout, Listener):
         self.tile_factory = TileWidgetFactory()
         self.map = map
         self.size = [self.map.size[0]*32, self.map.size[1]*32]
+        #  Pixel offsets for tile coordinates, so that get_screen_pos doesn't have to multiply every time.
+        #  It's a dict rather than a list because targeting cursor can leave the map, including negative
+        #  coordinates that a list would silently wrap around
+        self._px = {x: x*32 for x in range(max(self.map.size))}
         #  Adding LayerWidgets for every layer of the map
         self.layer_widgets = {}
         for layer in self.map.layers:
@@ -570,17 +804,91 @@ class RLMapWidget(RelativeLayout, Listener):
             self.add_widget(self.layer_widgets[layer])
         #  This is set to True during animation to avoid mistakes
         self.animating = False
+        #  Number of animations started and not yet completed. Several can run at once, see animate_moved()
+        self.running_animations = 0
         #  Queue of GameEvents to be animated
-        self.animation_queue = []
+        self.animation_queue = deque()
+        #  Animation step duration for the current turn
+        self.anim_duration = ANIMATION_DURATION
         #  A temporary widget slot for stuff like explosions, spell effects and such
         self.overlay_widget = None
+        #  Textures for overlays, loaded once instead of for every event
+        self.rocket_texture = CoreImage('Rocket.png').texture
+        #  Overlay widgets are created once and reused. There is never more than one of each kind on screen,
+        #  as events are animated one by one. Overlays are removed from self after animation, but not destroyed
+        self.explosion_widget = Image(source='Explosion.png',
+                                      size=(0, 0),
+                                      size_hint=(None, None))
+        self.shot_widget = Image(source='Shot.png',
+                                 size=(32, 32),
+                                 size_hint=(None, None))
+        #  Rocket is a plain Widget with a Rectangle drawn directly on its canvas. Its canvas is in parent
+        #  coordinates, so the rectangle and the rotation origin are moved along with the widget.
+        #  Rotation is created once, only the angle is changed per shot
+        self.rocket_widget = Widget(size=(32, 32),
+                                    size_hint=(None, None))
+        with self.rocket_widget.canvas.before:
+            PushMatrix()
+            self.rocket_rotate = Rotate(angle=0, axis=(0, 0, 1), origin=self.rocket_widget.center)
+        with self.rocket_widget.canvas:
+            self.rocket_rect = Rectangle(texture=self.rocket_texture,
+                                         size=(32, 32),
+                                         pos=self.rocket_widget.pos)
+        with self.rocket_widget.canvas.after:
+            PopMatrix()
+        self.rocket_widget.bind(pos=self.update_rocket_canvas)
+        #  Sound to be played on the next frame, see self.play_sound()
+        self.pending_sound = None
+        self.sound_trigger = Clock.create_trigger(self._play_pending_sound)
+        #  Continues processing of animation queue on the next frame, see self.animate_game_event()
+        self.resume_trigger = Clock.create_trigger(self._resume_animation)
+        #  Destruction animation doesn't depend on anything but duration, so it is created once per duration
+        #  and reused for every widget. Other animations have event-specific targets and are created anew
+        self.destroy_animations = {}
+        #  Animation methods for every animated event type. Each of these takes event and animation duration
+        #  and is responsible for calling self.animate_game_event() (directly or via Animation callbacks)
+        self.event_methods = {'moved': self.animate_moved,
+                              'attacked': self.animate_attacked,
+                              'was_destroyed': self.animate_was_destroyed,
+                              'picked_up': self.animate_picked_up,
+                              'dropped': self.animate_dropped,
+                              'actor_spawned': self.animate_actor_spawned,
+                              'construction_spawned': self.animate_construction_spawned,
+                              'exploded': self.animate_exploded,
+                              'rocket_shot': self.animate_rocket_shot,
+                              'shot': self.animate_shot}
         #  Debugging Dijkstra map view
         if DISPLAY_DIJKSTRA_MAP:
             self.dijkstra_widget = None
-            # self.dijkstra_widget = DijkstraWidget(parent=self)
-            # self.add_widget(self.dijkstra_widget)
+            #  Trigger is used so that multiple requests within a single frame cause only one rebuild
+            self.dijkstra_trigger = Clock.create_trigger(self.update_dijkstra_widget)
         self.counter = 0
 
+    def adopt_map(self, map):
+        """
+        Start displaying another map of the same size.
+        Background is redrawn in place, other layers get new LayerWidgets, as their MapItems need new widgets anyway
+        :param map: RLMap
+        :return:
+        """
+        assert map.size == self.map.size
+        self.map = map
+        self.animation_queue.clear()
+        if DISPLAY_DIJKSTRA_MAP and self.dijkstra_widget:
+            self.remove_widget(self.dijkstra_widget)
+            self.dijkstra_widget = None
+        for layer in list(self.layer_widgets.keys()):
+            if layer != 'bg':
+                self.remove_widget(self.layer_widgets.pop(layer))
+        for layer in self.map.layers:
+            if layer == 'bg' and layer in self.layer_widgets:
+                self.layer_widgets[layer].draw_bg(self)
+            else:
+                self.layer_widgets[layer] = LayerWidget(layer=layer, parent=self)
+                self.add_widget(self.layer_widgets[layer])
+        if DISPLAY_DIJKSTRA_MAP:
+            self.dijkstra_trigger()
+
 
 #########################################################
     #
@@ -596,167 +904,327 @@ class RLMapWidget(RelativeLayout, Listener):
         if event.event_type == 'queue_exhausted':
             #  Shoot animations only after the entire event batch for the turn has arrived
             #  Better to avoid multiple methods messing with self.animation_queue simultaneously
+            #  A run of consecutive moves is animated simultaneously, so it takes a single step
+            expected = 0
+            previous_type = None
+            for queued in self.animation_queue:
+                if not (queued.event_type == 'moved' and previous_type == 'moved'):
+                    expected += self.animation_lengths.get(queued.event_type, 0)
+                previous_type = queued.event_type
+            if expected * ANIMATION_DURATION > ANIMATION_TIME_BUDGET:
+                self.anim_duration = 0
+            else:
+                self.anim_duration = ANIMATION_DURATION
+            #  Keyboard is blocked for the entire processing, not just while an Animation is running.
+            #  Processing may yield to the next frame before any Animation starts (see animate_game_event())
+            self.animating = True
             self.animate_game_event()
+        elif event.event_type == 'moved' and self.animation_queue and\
+                self.animation_queue[-1].event_type == 'moved' and self.animation_queue[-1].actor is event.actor:
+            #  Movement animation always goes to actor's current location, so of several consecutive moves
+            #  by the same actor only one needs to be animated
+            self.animation_queue[-1] = event
         #  Ignore non-animatable events
         else:
             self.animation_queue.append(event)
 
-    def animate_game_event(self, widget=None, anim_duration=0.2):
+    def animate_game_event(self, widget=None):
         """
-        Process a single event from self.animation_queue
-        Read the event and perform the correct actions on widgets (such as update text of log window,
-        create and launch animation, maybe make some sound). The event is removed from self.map.game_events.
-        After the actions required are performed, the method calls itself again, either recursively, or, in
-        case of animations, via Animation's on_complete argument. The recursion is broken when event queue is
-        empty.
+        Process events from self.animation_queue
+        Read the events and perform the correct actions on widgets (such as update text of log window,
+        create and launch animation, maybe make some sound). Events are removed from self.animation_queue.
+        Events that are not animated are processed in a loop. When an animation is started, the method returns
+        and is called again by Animation's on_complete. Processing ends when event queue is empty.
+        Event-specific work is done by methods from self.event_methods, chosen by event type. These return
+        True if they have started an animation and False otherwise. If the loop runs for longer than
+        EVENT_PROCESSING_SLICE, the rest of the queue is processed on the next frame.
+        Animation step duration for the turn is taken from self.anim_duration.
+        :param widget: Widget whose animation has just been completed, if any
         :return:
         """
+        anim_duration = self.anim_duration
         if widget and widget.parent and widget.height == 0:
             #  If the widget was given zero size, this means it should be removed
             #  This entire affair is kinda inefficient and should be rebuilt later
             widget.parent.remove_widget(widget)
-        if not self.animation_queue == []:
-            event = self.animation_queue.pop(0)
-            if event.event_type == 'moved':
-                final = self.get_screen_pos(event.actor.location, center=True)
-                if final[0] < event.actor.widget.pos[0] and event.actor.widget.direction == 'right'\
-                        or final[0] > event.actor.widget.pos[0] and event.actor.widget.direction == 'left':
-                    event.actor.widget.flip()
-                a = Animation(center=final, duration=anim_duration)
-                a.bind(on_start=lambda x, y: self.remember_anim(),
-                       on_complete=lambda x, y: self.animate_game_event(widget=y))
-                a.start(event.actor.widget)
-            elif event.event_type == 'attacked':
-                current = self.get_screen_pos(event.actor.location, center=True)
-                target = self.get_screen_pos(event.location, center=True)
-                if target[0] > current[0] and event.actor.widget.direction == 'left' or\
-                        target[0] < current[0] and event.actor.widget.direction == 'right':
-                    event.actor.widget.flip()
-                a = Animation(center_x=current[0]+int((target[0]-current[0])/2),
-                              center_y=current[1]+int((target[1]-current[1])/2),
-                              duration=anim_duration/2)
-                a += Animation(center_x=current[0], center_y=current[1], duration=anim_duration/2)
-                a.bind(on_start=lambda x, y: self.remember_anim(),
-                       on_complete=lambda x, y: self.animate_game_event(widget=y))
-                a.start(event.actor.widget)
-                self.parent.boombox['attacked'].seek(0)
-                self.parent.boombox['attacked'].play()
-            elif event.event_type == 'was_destroyed':
-                if not event.actor.widget:
-                    #  If actor is None, that means it was destroyed right after spawning, not getting a
-                    #  widget. Similar case is covered under 'dropped', see there for example. The check is
-                    #  different here, because in 'dropped' item is taken from map, where it's None by the time
-                    #  this method runs. Here, on the other hand, Item object exists (in GameEvent), but has
-                    #  no widget (and is not placed on map, but that's irrelevant).
-                    self.animate_game_event()
+        started = perf_counter()
+        while self.animation_queue:
+            event = self.animation_queue.popleft()
+            if event.event_type in self.event_methods:
+                if self.event_methods[event.event_type](event, anim_duration):
+                    #  Animation was started, its on_complete will continue processing the queue
                     return
-                a = Animation(size=(0, 0), duration=anim_duration)
-                a.bind(on_start=lambda x, y: self.remember_anim(),
-                       on_complete=lambda x, y: self.animate_game_event(widget=y))
-                a.start(event.actor.widget)
-            elif event.event_type == 'picked_up':
-                #  It's assumed that newly added item will be the last in player inventory
-                self.layer_widgets['items'].remove_widget(self.map.actors[0].inventory[-1].widget)
-                self.animate_game_event()
-            elif event.event_type == 'dropped':
-                item = self.map.get_item(location=event.location, layer='items')
-                if not item:
-                    #  Item could've been destroyed right after being drop, ie it didn't get a widget. Skip.
-                    #  It's rather likely if someone was killed by landmine, dropped an item and had this item
-                    #  destroyed in the same explosion
-                    self.animate_game_event()
-                    return
-                if not item.widget:
-                    self.tile_factory.create_widget(item)
-                    item.widget.center = self.get_screen_pos(event.location, center=True)
-                self.layer_widgets['items'].add_widget(item.widget)
-                self.animate_game_event()
-            elif event.event_type == 'actor_spawned':
-                if not event.actor.widget:
-                    self.tile_factory.create_widget(event.actor)
-                event.actor.widget.center = self.get_screen_pos(event.location, center=True)
-                self.layer_widgets['actors'].add_widget(event.actor.widget)
-                self.animate_game_event()
-            elif event.event_type == 'construction_spawned':
-                if not event.actor.widget:
-                    self.tile_factory.create_widget(event.actor)
-                event.actor.widget.center = self.get_screen_pos(event.location, center=True)
-                self.layer_widgets['constructions'].add_widget(event.actor.widget)
-                self.animate_game_event()
-            elif event.event_type == 'exploded':
-                loc = self.get_screen_pos(event.location)
-                loc = (loc[0]+16, loc[1]+16)
-                self.overlay_widget = Image(source='Explosion.png',
-                                            size=(0, 0),
-                                            size_hint=(None, None),
-                                            pos=loc)
-                a = Animation(size=(96, 96), pos=(loc[0]-32, loc[1]-32),
-                              duration=0.3)
-                a += Animation(size=(0, 0), pos=loc,
-                               duration=0.3)
-                a.bind(on_start=lambda x, y: self.remember_anim(),
-                       on_complete=lambda x, y: self.animate_game_event(widget=y))
-                self.add_widget(self.overlay_widget)
-                self.parent.boombox['exploded'].seek(0)
-                self.parent.boombox['exploded'].play()
-                a.start(self.overlay_widget)
-            elif event.event_type == 'rocket_shot':
-                self.overlay_widget = RelativeLayout(center=self.get_screen_pos(event.actor.location, center=True),
-                                                     size=(64,64),
-                                                     size_hint=(None, None))
-                i = Image(source='Rocket.png',
-                          size=(32, 32),
-                          size_hint=(None, None))
-                self.overlay_widget.add_widget(i)
-                self.overlay_widget.canvas.before.add(Translate(x=16, y=16))
-                a = degrees(atan2(event.actor.location[1]-event.location[1],
-                                  event.actor.location[0]-event.location[0]))
-                # if abs(a) >= 90:
-                #     self.overlay_widget.center_y += 64
-                self.overlay_widget.canvas.before.add(Rotate(angle=a+90, axis=(0, 0, 1),
-                                                             origin=i.center))
-                a = Animation(center=self.get_screen_pos(event.location, center=True), duration=anim_duration)
-                a += Animation(size=(0, 0), duration=0)
-                a.bind(on_start=lambda x, y: self.remember_anim(),
-                       on_complete=lambda x, y: self.animate_game_event(widget=y))
-                self.add_widget(self.overlay_widget)
-                a.start(self.overlay_widget)
-            elif event.event_type == 'shot':
-                self.overlay_widget = Image(source='Shot.png',
-                                            size=(32, 32),
-                                            size_hint=(None, None),
-                                            pos=self.get_screen_pos(event.actor.location))
-                a = Animation(pos=self.get_screen_pos(event.location), duration=anim_duration)
-                a += Animation(size=(0, 0), duration=0)
-                a.bind(on_start=lambda x, y: self.remember_anim(),
-                       on_complete=lambda x, y: self.animate_game_event(widget=y))
-                self.add_widget(self.overlay_widget)
-                self.parent.boombox['shot'].seek(0)
-                self.parent.boombox['shot'].play()
-                a.start(self.overlay_widget)
             elif event.event_type in self.non_animated:
                 self.parent.process_nonmap_event(event)
-                self.animate_game_event()
+            if self.animation_queue and perf_counter() - started > EVENT_PROCESSING_SLICE:
+                #  Let Kivy draw a frame. self.animating was set when processing started, so keyboard
+                #  stays blocked and no new turn can start until the queue is drained
+                self.resume_trigger()
+                return
+        #  Reactivating keyboard after finishing animation
+        self.animating = False
+        #  Keys are ignored while animating, so normally nothing is waiting here. This only makes sure a
+        #  command that process_pending_commands had to skip isn't left unprocessed
+        if self.parent.pending_commands:
+            self.parent.turn_trigger()
+        #  Might as well be time to redraw the Dijkstra widget
+        if DISPLAY_DIJKSTRA_MAP:
+            self.dijkstra_trigger()
+
+    def animate_moved(self, event, anim_duration):
+        #  Moves of different actors that follow each other in the queue are independent, so they are
+        #  animated simultaneously. Queue processing continues after all of them are complete.
+        #  When the turn is shown instantly, widgets are just placed at their destinations
+        moving = set()
+        started = False
+        while True:
+            moving.add(event.actor)
+            final = self.get_screen_pos(event.actor.location, center=True)
+            #  No Animation is needed if the widget is already there (eg actor moved and returned)
+            if tuple(event.actor.widget.center) != final:
+                if (final[0]-event.actor.widget.pos[0]) * event.actor.widget.direction < 0:
+                    event.actor.widget.flip()
+                if anim_duration:
+                    a = Animation(center=final, duration=anim_duration)
+                    a.fbind('on_start', self._on_anim_start)
+                    a.fbind('on_complete', self._on_anim_complete)
+                    a.start(event.actor.widget)
+                    started = True
+                else:
+                    event.actor.widget.center = final
+            if not self.animation_queue or self.animation_queue[0].event_type != 'moved' or\
+                    self.animation_queue[0].actor in moving:
+                return started
+            event = self.animation_queue.popleft()
+
+    def animate_attacked(self, event, anim_duration):
+        current = self.get_screen_pos(event.actor.location, center=True)
+        target = self.get_screen_pos(event.location, center=True)
+        if (target[0]-current[0]) * event.actor.widget.direction < 0:
+            event.actor.widget.flip()
+        if not anim_duration:
+            #  Instant turn: the lunge wouldn't be visible, only its end position matters
+            event.actor.widget.center = current
+            return False
+        a = Animation(center_x=current[0]+int((target[0]-current[0])/2),
+                      center_y=current[1]+int((target[1]-current[1])/2),
+                      duration=anim_duration/2)
+        a += Animation(center_x=current[0], center_y=current[1], duration=anim_duration/2)
+        a.fbind('on_start', self._on_anim_start)
+        a.fbind('on_complete', self._on_anim_complete)
+        a.start(event.actor.widget)
+        self.play_sound('attacked', anim_duration)
+        return True
+
+    def animate_was_destroyed(self, event, anim_duration):
+        if not event.actor.widget:
+            #  If actor is None, that means it was destroyed right after spawning, not getting a
+            #  widget. Similar case is covered under 'dropped', see there for example. The check is
+            #  different here, because in 'dropped' item is taken from map, where it's None by the time
+            #  this method runs. Here, on the other hand, Item object exists (in GameEvent), but has
+            #  no widget (and is not placed on map, but that's irrelevant).
+            return False
+        if anim_duration not in self.destroy_animations:
+            a = Animation(size=(0, 0), duration=anim_duration)
+            a.fbind('on_start', self._on_anim_start)
+            a.fbind('on_complete', self._on_anim_complete)
+            self.destroy_animations[anim_duration] = a
+        self.destroy_animations[anim_duration].start(event.actor.widget)
+        return True
+
+    def animate_picked_up(self, event, anim_duration):
+        #  The picked item is no longer on the map, but its widget is still in the items layer at the
+        #  location it was picked up from. There can be only one item per tile, so it's found by position
+        items_layer = self.layer_widgets['items']
+        center = self.get_screen_pos(event.location, center=True)
+        picked = None
+        for child in items_layer.children:
+            if tuple(child.center) == center:
+                picked = child
+                break
+        if picked is None:
+            return False
+        #  If the same actor drops this very item later in the batch, the widget is moved to the drop
+        #  location and that 'dropped' event is discarded. The widget is placed rather than animated,
+        #  as 'dropped' is not animated either; an Animation here would only delay the rest of the queue
+        for queued in self.animation_queue:
+            if queued.event_type == 'dropped' and queued.actor is event.actor:
+                item = self.map.get_item(location=queued.location, layer='items')
+                if item and item.widget is picked:
+                    picked.center = self.get_screen_pos(queued.location, center=True)
+                    self.animation_queue.remove(queued)
+                    return False
+        items_layer.remove_widget(picked)
+        return False
+
+    def animate_dropped(self, event, anim_duration):
+        item = self.map.get_item(location=event.location, layer='items')
+        if not item:
+            #  Item could've been destroyed right after being drop, ie it didn't get a widget. Skip.
+            #  It's rather likely if someone was killed by landmine, dropped an item and had this item
+            #  destroyed in the same explosion
+            return False
+        if not item.widget:
+            self.tile_factory.create_widget(item)
+            item.widget.center = self.get_screen_pos(event.location, center=True)
+        self.layer_widgets['items'].add_widget(item.widget)
+        return False
+
+    def animate_actor_spawned(self, event, anim_duration):
+        if not event.actor.widget:
+            self.tile_factory.create_widget(event.actor)
+        event.actor.widget.center = self.get_screen_pos(event.location, center=True)
+        self.layer_widgets['actors'].add_widget(event.actor.widget)
+        return False
+
+    def animate_construction_spawned(self, event, anim_duration):
+        if not event.actor.widget:
+            self.tile_factory.create_widget(event.actor)
+        event.actor.widget.center = self.get_screen_pos(event.location, center=True)
+        self.layer_widgets['constructions'].add_widget(event.actor.widget)
+        return False
+
+    def animate_exploded(self, event, anim_duration):
+        if not self.is_on_screen(event.location):
+            #  Nothing to show, so no overlay or Animation is set up
+            return False
+        loc = self.get_screen_pos(event.location)
+        loc = (loc[0]+16, loc[1]+16)
+        self.overlay_widget = self.explosion_widget
+        self.overlay_widget.size = (0, 0)
+        self.overlay_widget.pos = loc
+        a = Animation(size=(96, 96), pos=(loc[0]-32, loc[1]-32),
+                      duration=anim_duration*1.5)
+        a += Animation(size=(0, 0), pos=loc,
+                       duration=anim_duration*1.5)
+        a.fbind('on_start', self._on_anim_start)
+        a.fbind('on_complete', self._on_anim_complete)
+        self.add_widget(self.overlay_widget)
+        self.play_sound('exploded', anim_duration)
+        a.start(self.overlay_widget)
+        return True
 
+    def animate_rocket_shot(self, event, anim_duration):
+        if not self.is_on_screen(event.location):
+            return False
+        self.overlay_widget = self.rocket_widget
+        self.overlay_widget.size = (32, 32)
+        self.overlay_widget.center = self.get_screen_pos(event.actor.location, center=True)
+        dx = event.actor.location[0]-event.location[0]
+        dy = event.actor.location[1]-event.location[1]
+        try:
+            angle = ANGLE_TABLE[(dx, dy)]
+        except KeyError:
+            angle = degrees(atan2(dy, dx))
+        #  Sprite is rotated around its own center, so no position correction is needed for any angle
+        self.rocket_rotate.angle = angle+90
+        a = Animation(center=self.get_screen_pos(event.location, center=True), duration=anim_duration)
+        a.fbind('on_start', self._on_anim_start)
+        a.fbind('on_complete', self._on_anim_complete)
+        self.add_widget(self.overlay_widget)
+        a.start(self.overlay_widget)
+        return True
+
+    def animate_shot(self, event, anim_duration):
+        if not self.is_on_screen(event.location):
+            return False
+        self.overlay_widget = self.shot_widget
+        self.overlay_widget.size = (32, 32)
+        self.overlay_widget.pos = self.get_screen_pos(event.actor.location)
+        a = Animation(pos=self.get_screen_pos(event.location), duration=anim_duration)
+        a.fbind('on_start', self._on_anim_start)
+        a.fbind('on_complete', self._on_anim_complete)
+        self.add_widget(self.overlay_widget)
+        self.play_sound('shot', anim_duration)
+        a.start(self.overlay_widget)
+        return True
+
+    def play_sound(self, sound, anim_duration):
+        """
+        Play a sound from parent's boombox, unless the turn is shown instantly.
+        The sound is actually started on the next frame, together with the first frame of the animation,
+        so that seeking and starting it doesn't delay setting the animation up
+        :param sound: str. boombox key
+        :param anim_duration: float. Animation step duration
+        :return:
+        """
+        if anim_duration:
+            self.pending_sound = sound
+            self.sound_trigger()
+
+    def _resume_animation(self, dt):
+        """
+        Continue processing animation queue after self.animate_game_event() has yielded.
+        Called via self.resume_trigger
+        :param dt: float. Clock interval, ignored
+        :return:
+        """
+        #  Widget could have been removed (eg on map change) in the meantime
+        if self.parent:
+            self.animate_game_event()
+
+    def _play_pending_sound(self, dt):
+        """
+        Play the sound requested by self.play_sound(). Called via self.sound_trigger
+        :param dt: float. Clock interval, ignored
+        :return:
+        """
+        #  Widget could have been removed (eg on map change) after the sound was requested
+        if self.pending_sound and self.parent:
+            sound = self.parent.boombox[self.pending_sound]
+            sound.seek(0)
+            sound.play()
+        self.pending_sound = None
+
+    def update_dijkstra_widget(self, dt):
+        """
+        Update Dijkstra debug widget, creating it if necessary.
+        Called via self.dijkstra_trigger, so it runs at most once per frame
+        :param dt: float. Clock interval, ignored
+        :return:
+        """
+        if self.dijkstra_widget:
+            self.dijkstra_widget.update()
         else:
-            #  Reactivating keyboard after finishing animation
-            self.animating = False
-            #  Might as well be time to redraw the Dijkstra widget
-            if DISPLAY_DIJKSTRA_MAP:
-                if self.dijkstra_widget:
-                    self.remove_widget(self.dijkstra_widget)
-                # else:
-                #     self.map.dijkstras['PC'].rebuild_self()
-                self.dijkstra_widget = DijkstraWidget(parent=self)
-                self.add_widget(self.dijkstra_widget)
-
-    def remember_anim(self):
-        '''
-        This is a separate method because lambdas cannot into assignment, and animation queue
-         depends on lambdas not to be evaluated prematurely.
-        :return:
-        '''
+            #  New widget is up to date already
+            self.dijkstra_widget = DijkstraWidget(parent=self)
+            self.add_widget(self.dijkstra_widget)
+
+    def _on_anim_start(self, animation, widget):
+        """
+        Animation on_start callback. Blocks keyboard until the animation queue is exhausted.
+        Bound methods are used instead of lambdas so that no new callables are created for every event.
+        :param animation: Animation
+        :param widget: Widget being animated
+        :return:
+        """
         self.animating = True
+        self.running_animations += 1
+
+    def _on_anim_complete(self, animation, widget):
+        """
+        Animation on_complete callback. Proceeds to the next event in the animation queue
+        once all simultaneously running animations are complete
+        :param animation: Animation
+        :param widget: Widget being animated
+        :return:
+        """
+        if widget is self.rocket_widget or widget is self.shot_widget:
+            #  Projectiles vanish upon arrival. Zero size marks them for removal by animate_game_event
+            widget.size = (0, 0)
+        self.running_animations -= 1
+        if self.running_animations == 0:
+            self.animate_game_event(widget=widget)
+
+    def update_rocket_canvas(self, widget, pos):
+        """
+        Move rocket rectangle and its rotation origin along with self.rocket_widget
+        :param widget: Widget
+        :param pos: new widget position
+        :return:
+        """
+        self.rocket_rect.pos = pos
+        self.rocket_rotate.origin = widget.center
 
     def get_screen_pos(self, location, parent=False, center=False):
         """
@@ -767,14 +1235,28 @@ class RLMapWidget(RelativeLayout, Listener):
         :param center: bool. If True, return coordinates for tile center, otherwise return bottom-left corner
         :return: int tuple
         """
-        r = [location[0]*32, location[1]*32]
+        try:
+            x, y = self._px[location[0]], self._px[location[1]]
+        except KeyError:
+            #  Off-map location
+            x, y = location[0]*32, location[1]*32
         if center:
-            r[0] += 16
-            r[1] += 16
+            x += 16
+            y += 16
         if not parent:
-            return r
+            return x, y
         else:
-            return self.to_parent(r[0], r[1])
+            return self.to_parent(x, y)
+
+    def is_on_screen(self, location):
+        """
+        Return True if the tile at a given location is within self.
+        Used to skip overlay animations that wouldn't be visible anyway
+        :param location: int tuple
+        :return: bool
+        """
+        pos = self.get_screen_pos(location)
+        return 0 <= pos[0] < self.width and 0 <= pos[1] < self.height
 
     def update_rect(self, pos, size):
         self.rect.pos = self.pos
@@ -801,10 +1283,9 @@ class LogWindow(Label):
         Take a single log line from game_manager.game_log and append it to deque
         :return:
         """
-        line = self.game_manager.game_log.pop(0)
+        line = self.game_manager.game_log.popleft()
         self.lines.append(line)
         self.text = '\n'.join(self.lines)
-        self.canvas.ask_update()
 
 
 class StatusWindow(BoxLayout):
@@ -854,27 +1335,38 @@ class HPWidget(Label):
         #  HARDCODE IS BAD! MAKE SOME MORE ADAPTIVE THINGIE SOME OTHER TIME
         self.font_size = 22
         self.text = 'SOMETHING WRONG'
+        #  Values currently displayed. Text is not rebuilt if they didn't change.
+        #  False is never a valid value, so the first update always sets text
+        self.shown_values = False
         with self.canvas.before:
             Color(1, 1, 1)
             self.rect = Rectangle(size=self.size, pos=self.pos)
         self.bind(size=self.rebuild_canvas, pos=self.rebuild_canvas)
 
     def rebuild_canvas(self, *args, **kwargs):
-        self.rect.pos = self.pos
-        self.rect.size = self.size
-        self.canvas.ask_update()
+        #  Both size and pos changes call this, so the property that didn't change is left alone
+        pos, size = tuple(self.pos), tuple(self.size)
+        if self.rect.pos != pos:
+            self.rect.pos = pos
+        if self.rect.size != size:
+            self.rect.size = size
 
     def update_text(self):
         #  Check that zeroth actor is, in fact, PC. After PC death it could be some other actor
-        if isinstance(self.game_manager.map.actors[0].controller, PlayerController):
-            self.text = 'HP {0}/{1}\nAmmo {2}/{3}'.format(self.game_manager.map.actors[0].fighter.hp,
-                                                          self.game_manager.map.actors[0].fighter.max_hp,
-                                                          self.game_manager.map.actors[0].fighter.ammo,
-                                                          self.game_manager.map.actors[0].fighter.max_ammo)
+        if self.game_manager.map.actors[0] is self.game_manager.pc:
+            fighter = self.game_manager.map.actors[0].fighter
+            values = (fighter.hp, fighter.max_hp, fighter.ammo, fighter.max_ammo)
+        else:
+            values = None
+        if values == self.shown_values:
+            #  Nothing changed since the last update, ie event didn't really affect the PC
+            return
+        self.shown_values = values
+        if values:
+            self.text = 'HP {0}/{1}\nAmmo {2}/{3}'.format(*values)
         else:
             #  Easter eggs are bad, except when they are over half a century old
             self.text = 'So it goes'
-        self.canvas.ask_update()
 
 
 class InventoryWidget(BoxLayout):
@@ -903,6 +1395,8 @@ class InventoryWidget(BoxLayout):
             self.right_box.add_widget(item_widget)
         self.add_widget(self.left_box)
         self.add_widget(self.right_box)
+        #  Items currently displayed. Widgets are not touched if inventory didn't change
+        self.shown_items = None
 
     def redraw_inventory(self):
         """
@@ -910,13 +1404,15 @@ class InventoryWidget(BoxLayout):
         Read the map.actors[0] inventory and draw everything it finds inside it.
         :return:
         """
+        items = tuple(self.game_manager.map.actors[0].inventory.items)
+        if items == self.shown_items:
+            return
+        self.shown_items = items
         for x in range(10):
             try:
-                item = self.game_manager.map.actors[0].inventory[x]
-                self.item_widgets[x].change_item(item)
+                self.item_widgets[x].change_item(items[x])
             except IndexError:
                 self.item_widgets[x].remove_item()
-        self.canvas.ask_update()
 
 
 class InventoryItemWidget(RelativeLayout):
@@ -944,10 +1440,13 @@ class InventoryItemWidget(RelativeLayout):
         :param item:
         :return:
         """
+        #  Existing Image is reused, and only reloaded if the item looks different
         if self.item_image:
-            self.remove_widget(self.item_image)
-        self.item_image = Image(source=item.image_source, size=(64, 64))
-        self.add_widget(self.item_image)
+            if self.item_image.source != item.image_source:
+                self.item_image.source = item.image_source
+        else:
+            self.item_image = Image(source=item.image_source, size=(64, 64))
+            self.add_widget(self.item_image)
 
     def remove_item(self):
         """
@@ -972,8 +1471,8 @@ class CampApp(App):
         root = BoxLayout(orientation='vertical')
         self.game_manager = GameManager(map_file='test_level.lvl')
         self.game_manager.switch_map('entrance')
+        #  GameWidget sizes itself after the map in rebuild_widgets(), so no initial size is given
         self.game_widget = GameWidget(game_manager=self.game_manager,
-                                      size=Window.size,
                                       size_hint=(None, None),
                                       pos=(0, 0))
         #  Registering universal listeners